@@ -2,7 +2,6 @@
 # /// script
 # requires-python = ">=3.8"
 # dependencies = [
-#     "click>=8.1.0",
 #     "rich>=13.0.0",
 # ]
 # ///
@@ -14,150 +13,369 @@ Usage:
     uv run scripts/build.py --mode debug --tests --clean
 """
 
+import argparse
+import functools
+import hashlib
 import os
+import shlex
 import shutil
 import subprocess
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
-
-import click
-from rich.console import Console
-from rich.panel import Panel
-from rich.progress import Progress, SpinnerColumn, TextColumn
-from rich.table import Table
-
-console = Console()
+from typing import Callable, Optional
+
+
+@functools.lru_cache(maxsize=None)
+def get_console():
+    """Create the Rich console on first use so --help doesn't pay for importing Rich."""
+    from rich.console import Console
+    return Console()
+
+
+def run_command(cmd: list[str], cwd: Optional[Path] = None, check: bool = True,
+                env: Optional[dict[str, str]] = None, verbose: bool = False) -> subprocess.CompletedProcess:
+    """Run a shell command, streaming its output line by line."""
+    if verbose:
+        get_console().print(f"$ {shlex.join(cmd)}", style="dim", markup=False)
+
+    with subprocess.Popen(
+        cmd,
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+        bufsize=1
+    ) as proc:
+        for line in proc.stdout:
+            get_console().out(line, end="", highlight=False)
+        returncode = proc.wait()
+
+    if check and returncode != 0:
+        from rich.markup import escape
+
+        get_console().print(f"[red]ERROR:[/red] Command failed ({returncode}): {escape(shlex.join(cmd))}")
+        sys.exit(1)
 
+    return subprocess.CompletedProcess(cmd, returncode)
 
-def run_command(cmd: list[str], cwd: Optional[Path] = None, check: bool = True) -> subprocess.CompletedProcess:
-    """Run a shell command with pretty logging."""
-    console.print(f"[dim]Running:[/dim] [cyan]{' '.join(cmd)}[/cyan]")
 
+def cpu_count() -> int:
+    """Return the CPUs this process may run on, honouring container/affinity limits."""
     try:
-        result = subprocess.run(
-            cmd,
-            cwd=cwd,
-            check=check,
-            capture_output=True,
-            text=True
-        )
-        if result.stdout.strip():
-            console.print(f"[dim]{result.stdout.strip()}[/dim]")
-        return result
-
-    except subprocess.CalledProcessError as e:
-        console.print(f"[red]ERROR:[/red] Command failed: {' '.join(cmd)}")
-        if e.stdout:
-            console.print(f"[yellow]STDOUT:[/yellow]\n{e.stdout}")
-        if e.stderr:
-            console.print(f"[red]STDERR:[/red]\n{e.stderr}")
-        sys.exit(1)
-
-
-@click.command()
-@click.option(
-    "--mode",
-    type=click.Choice(["debug", "release"], case_sensitive=False),
-    default="debug",
-    help="Build configuration"
-)
-@click.option("--tests", is_flag=True, help="Build tests")
-@click.option("--clean", is_flag=True, help="Clean build directory")
-@click.option("--verbose", is_flag=True, help="Verbose build")
-@click.option("--export-compile-commands", is_flag=True, help="Export compile_commands.json")
-@click.option("--jobs", type=int, default=None, help="Parallel build jobs")
-def main(mode: str, tests: bool, clean: bool, verbose: bool,
-         export_compile_commands: bool, jobs: Optional[int]):
-    """Build AI SDK C++."""
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 4
+
+
+def step(desc: str, fn: Callable[[], object]) -> None:
+    """Run one build phase, printing its start marker and elapsed time."""
+    get_console().print(f"[cyan]▶[/cyan] {desc}")
+    start = time.perf_counter()
+    fn()
+    get_console().print(f"[green]✓[/green] {desc} [dim]({time.perf_counter() - start:.1f}s)[/dim]")
+
+
+def select_generator() -> Optional[str]:
+    """Pick the Ninja generator when available, otherwise leave CMake's default."""
+    if not shutil.which("ninja"):
+        get_console().print("[yellow]WARNING:[/yellow] ninja not found, using CMake's default generator")
+        return None
+    return "Ninja"
+
+
+def cached_generator(build_dir: Path) -> Optional[str]:
+    """Return the generator recorded in an existing CMakeCache.txt, if any."""
+    cache = build_dir / "CMakeCache.txt"
+    if not cache.exists():
+        return None
+    for line in cache.read_text(errors="replace").splitlines():
+        if line.startswith("CMAKE_GENERATOR:INTERNAL="):
+            return line.split("=", 1)[1]
+    return None
+
+
+def fast_rmtree(path: Path, workers: int = 8) -> None:
+    """Remove a directory tree, deleting its top-level entries concurrently."""
+    def remove(entry: os.DirEntry) -> None:
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path)
+        else:
+            os.unlink(entry.path)
+
+    # Like shutil.rmtree, never follow a symlinked root into its target
+    if path.is_symlink():
+        raise OSError(f"Cannot remove {path}: refusing to delete through a symbolic link")
+
+    with os.scandir(path) as it:
+        entries = list(it)
+    # unlink releases the GIL, so threads overlap the filesystem I/O
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Consume the results so the first failure is raised here
+        list(executor.map(remove, entries))
+    path.rmdir()
+
+
+def link_file(src: Path, dst: Path) -> str:
+    """Point dst at src via symlink, hardlink or copy; return the method used."""
+    dst.unlink(missing_ok=True)
+    try:
+        # CMake rewrites the file through a rename, so only a symlink keeps tracking it
+        dst.symlink_to(os.path.relpath(src, dst.parent))
+        return "symlinked"
+    except OSError:
+        pass
+    try:
+        os.link(src, dst)
+        return "hardlinked"
+    except OSError:
+        shutil.copy2(src, dst)
+        return "copied"
+
+
+def parse_ninja_log(path: Path, offset: int = 0, limit: int = 10) -> list[tuple[str, float]]:
+    """Return the slowest (target, seconds) steps logged after offset in a .ninja_log.
+
+    An offset past the end of the file means Ninja recompacted the log; the
+    whole file is read then, and the result can mix steps from earlier builds.
+    """
+    data = path.read_bytes()
+    steps: dict[str, tuple[str, float]] = {}
+    for line in data[offset if offset <= len(data) else 0:].decode(errors="replace").splitlines():
+        if line.startswith("#"):
+            continue
+        fields = line.split("\t")
+        if len(fields) < 5:
+            continue
+        start, end, target, cmd_hash = int(fields[0]), int(fields[1]), fields[3], fields[4]
+        # Steps with several outputs log one line each; count the command once
+        steps[cmd_hash] = (target, (end - start) / 1000)
+    return sorted(steps.values(), key=lambda entry: entry[1], reverse=True)[:limit]
+
+
+def configure_stamp(cmake_args: list[str]) -> str:
+    """Hash the configure arguments so an unchanged configure step can be skipped.
+
+    Edits to CMakeLists.txt files are deliberately not part of the stamp: the
+    generated build system depends on them and re-runs CMake from within
+    `cmake --build`, so no separate configure process is needed.
+    """
+    key = "\0".join(cmake_args)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def parse_args(argv: list[str]) -> tuple[argparse.Namespace, list[str]]:
+    """Parse build options; anything after `--` is returned for the native build tool."""
+    native_args: list[str] = []
+    if "--" in argv:
+        split = argv.index("--")
+        argv, native_args = argv[:split], argv[split + 1:]
+
+    parser = argparse.ArgumentParser(
+        description="Build AI SDK C++.",
+        epilog="Arguments after -- are forwarded to the native build tool, "
+               "e.g. `uv run scripts/build.py -- -d stats`."
+    )
+    parser.add_argument("--mode", type=str.lower, choices=["debug", "release"], default="debug",
+                        help="Build configuration")
+    parser.add_argument("--tests", action="store_true", help="Build tests")
+    parser.add_argument("--clean", action="store_true", help="Clean build directory")
+    parser.add_argument("--verbose", action="store_true", help="Verbose build")
+    parser.add_argument("--export-compile-commands", action="store_true", help="Keep a valid project-root compile_commands.json through --clean")
+    parser.add_argument("--jobs", type=int, default=None, help="Parallel build jobs")
+    parser.add_argument("--no-cache", action="store_true", help="Disable ccache/sccache compiler launcher")
+    parser.add_argument("--hotspots", action="store_true",
+                        help="Show the slowest build steps (always on with --verbose)")
+    return parser.parse_args(argv), native_args
+
+
+def build(mode: str, tests: bool, clean: bool, verbose: bool,
+          export_compile_commands: bool, jobs: Optional[int], no_cache: bool,
+          hotspots: bool, native_args: list[str]):
+    """Configure and build AI SDK C++."""
     script_dir = Path(__file__).parent
     project_root = script_dir.parent
     build_dir = project_root / "build"
 
+    # Prefer sccache, fall back to ccache; enabled by default when found
+    launcher = None if no_cache else (shutil.which("sccache") or shutil.which("ccache"))
+
+    generator = select_generator()
+    config = mode.title()
+    effective_jobs = jobs or cpu_count()
+
     # -------------------------------
     # Show Build Configuration
     # -------------------------------
+    from rich.table import Table
+
     table = Table(title="Build Configuration", show_header=True, header_style="bold cyan")
     table.add_column("Setting", style="cyan")
     table.add_column("Value", style="green")
 
-    table.add_row("Project root", str(project_root))
-    table.add_row("Build directory", str(build_dir))
-    table.add_row("Build mode", mode.upper())
-    table.add_row("With tests", "✓" if tests else "✗")
-    table.add_row("Clean build", "✓" if clean else "✗")
-    table.add_row("Export compile commands", "✓" if export_compile_commands else "✗")
-    table.add_row("Parallel jobs", str(jobs or os.cpu_count() or 4))
-
-    console.print(table)
-    console.print()
+    rows = [
+        ("Project root", str(project_root)),
+        ("Build directory", str(build_dir)),
+        ("Build mode", mode.upper()),
+        ("Generator", generator or "CMake default"),
+        ("With tests", "✓" if tests else "✗"),
+        ("Clean build", "✓" if clean else "✗"),
+        ("Keep compile commands through clean", "✓" if export_compile_commands else "✗"),
+        ("Parallel jobs", str(effective_jobs)),
+        ("Compiler cache", Path(launcher).name if launcher else "✗"),
+    ]
+    for setting, value in rows:
+        table.add_row(setting, value)
+
+    # Render once and write the result directly, bypassing Rich's live display
+    console = get_console()
+    with console.capture() as capture:
+        console.print(table)
+        console.print()
+    sys.stdout.write(capture.get())
 
     # -------------------------------
     # Clean build directory
     # -------------------------------
+    root_compile_commands = project_root / "compile_commands.json"
+
     if clean and build_dir.exists():
-        with Progress(SpinnerColumn(), TextColumn("[progress.description]{task.description}")) as progress:
-            task = progress.add_task("Cleaning build directory...", total=None)
-            shutil.rmtree(build_dir)
-            progress.update(task, completed=True)
-        console.print("[green]✓ Cleaned build directory[/green]")
+        # Swap the link for a real copy so clangd keeps a database while build/ is rebuilt
+        if export_compile_commands and root_compile_commands.is_symlink() and root_compile_commands.exists():
+            snapshot = root_compile_commands.read_bytes()
+            root_compile_commands.unlink()
+            root_compile_commands.write_bytes(snapshot)
+        step("Cleaning build directory", lambda: fast_rmtree(build_dir))
 
     build_dir.mkdir(exist_ok=True)
 
+    # CMake refuses to switch generators in an existing tree, so drop the stale cache.
+    # Without ninja, a tree configured for Ninja would otherwise keep reusing it.
+    previous = cached_generator(build_dir)
+    if generator:
+        stale = previous is not None and previous != generator
+    else:
+        stale = previous is not None and previous.startswith("Ninja")
+    if stale:
+        get_console().print(f"[yellow]WARNING:[/yellow] build directory uses '{previous}', "
+                            f"reconfiguring for '{generator or 'CMake default'}'")
+        (build_dir / "CMakeCache.txt").unlink()
+        shutil.rmtree(build_dir / "CMakeFiles", ignore_errors=True)
+
     # -------------------------------
     # CMake configure
     # -------------------------------
-    with Progress(SpinnerColumn(), TextColumn("[progress.description]{task.description}")) as progress:
-        task = progress.add_task("Configuring with CMake...", total=None)
-
-        cmake_args = [
-            "cmake",
-            str(project_root),
-            "-G", "Ninja",
-            f"-DCMAKE_BUILD_TYPE={mode.title()}",
-            f"-DBUILD_TESTS={'ON' if tests else 'OFF'}",
-            "-DBUILD_EXAMPLES=ON"
-        ]
-
-        if export_compile_commands:
-            cmake_args.append("-DCMAKE_EXPORT_COMPILE_COMMANDS=ON")
+    cmake_args = [
+        "cmake",
+        str(project_root),
+        f"-DBUILD_TESTS={'ON' if tests else 'OFF'}",
+        "-DBUILD_EXAMPLES=ON"
+    ]
+
+    if generator:
+        cmake_args.extend(["-G", generator])
+
+    cmake_args.append(f"-DCMAKE_BUILD_TYPE={config}")
+
+    # Always exported: it is nearly free and lets clangd index during the build
+    cmake_args.append("-DCMAKE_EXPORT_COMPILE_COMMANDS=ON")
+
+    if launcher:
+        cmake_args.extend([
+            f"-DCMAKE_C_COMPILER_LAUNCHER={launcher}",
+            f"-DCMAKE_CXX_COMPILER_LAUNCHER={launcher}",
+        ])
+    else:
+        # Clear a launcher cached by an earlier run (or one that was since uninstalled)
+        cmake_args.extend(["-UCMAKE_C_COMPILER_LAUNCHER", "-UCMAKE_CXX_COMPILER_LAUNCHER"])
+
+    stamp_file = build_dir / ".build_py_stamp"
+    stamp = configure_stamp(cmake_args)
+    configured = (
+        (build_dir / "CMakeCache.txt").exists()
+        and stamp_file.exists()
+        and stamp_file.read_text() == stamp
+    )
 
-        run_command(cmake_args, cwd=build_dir)
-        progress.update(task, completed=True)
+    # Only configure when the arguments changed; otherwise the build step alone
+    # regenerates the build system if any CMakeLists.txt is newer than it
+    if configured:
+        get_console().print("[green]✓[/green] CMake configuration up to date, skipping configure")
+    else:
+        # Drop the old stamp first so a failed configure is never treated as current
+        stamp_file.unlink(missing_ok=True)
+        step("Configuring with CMake", lambda: run_command(cmake_args, cwd=build_dir, verbose=verbose))
+        stamp_file.write_text(stamp)
 
-    console.print("[green]✓ CMake configured[/green]")
+    # -------------------------------
+    # Export compile commands
+    # -------------------------------
+    # Linked before building so editors can re-index while compilation runs
+    build_compile_commands = build_dir / "compile_commands.json"
+    already_linked = (
+        root_compile_commands.is_symlink()
+        and root_compile_commands.resolve() == build_compile_commands.resolve()
+    )
+    method = "symlinked" if already_linked else None
+    if build_compile_commands.exists() and not already_linked:
+        method = link_file(build_compile_commands, root_compile_commands)
+        get_console().print(f"[green]✓[/green] Exported compile_commands.json to {root_compile_commands} ({method})")
 
     # -------------------------------
     # Build
     # -------------------------------
-    with Progress(SpinnerColumn(), TextColumn("[progress.description]{task.description}")) as progress:
-        task = progress.add_task("Building...", total=None)
+    build_args = ["cmake", "--build", "."]
+
+    if verbose:
+        build_args.append("--verbose")
 
-        build_args = ["cmake", "--build", "."]
+    build_args.append(f"-j{effective_jobs}")
 
-        if verbose:
-            build_args.append("--verbose")
+    if native_args:
+        build_args.extend(["--", *native_args])
 
-        build_args.extend(["--parallel", str(jobs or os.cpu_count() or 4)])
+    # Export the job count so nested `cmake --build` sub-builds parallelize too
+    build_env = {**os.environ, "CMAKE_BUILD_PARALLEL_LEVEL": str(effective_jobs)}
+    build_env.setdefault("NINJA_STATUS", "[%f/%t %es] ")
 
-        run_command(build_args, cwd=build_dir)
-        progress.update(task, completed=True)
+    # Remember where this build's entries start in the Ninja log
+    ninja_log = build_dir / ".ninja_log"
+    log_offset = ninja_log.stat().st_size if ninja_log.exists() else 0
 
-    console.print("[green]✓ Build successful![/green]")
+    step("Building", lambda: run_command(build_args, cwd=build_dir, env=build_env, verbose=verbose))
+
+    # A hardlink or copy goes stale if the build re-ran CMake, which replaces the file
+    if method != "symlinked" and build_compile_commands.exists():
+        method = link_file(build_compile_commands, root_compile_commands)
+        get_console().print(f"[green]✓[/green] Refreshed compile_commands.json at {root_compile_commands} ({method})")
 
     # -------------------------------
-    # Export compile commands
+    # Build hotspots
     # -------------------------------
-    if export_compile_commands:
-        src = build_dir / "compile_commands.json"
-        dst = project_root / "compile_commands.json"
-        if src.exists():
-            shutil.copy2(src, dst)
-            console.print(f"[green]✓ Exported compile_commands.json to {dst}[/green]")
+    slowest = parse_ninja_log(ninja_log, log_offset) if (hotspots or verbose) and ninja_log.exists() else []
+    if slowest:
+        # A recompacted log is rewritten in hash order, so this build's steps can't be isolated
+        recompacted = ninja_log.stat().st_size < log_offset
+        title = "Slowest Build Steps (log recompacted, may include earlier builds)" if recompacted else "Slowest Build Steps"
+        hotspot_table = Table(title=title, show_header=True, header_style="bold cyan")
+        hotspot_table.add_column("Target", style="cyan")
+        hotspot_table.add_column("Time (s)", style="green", justify="right")
+
+        for target, seconds in slowest:
+            hotspot_table.add_row(target, f"{seconds:.1f}")
+
+        get_console().print(hotspot_table)
 
     # -------------------------------
     # Results panel
     # -------------------------------
+    # examples/CMakeLists.txt suffixes debug example binaries with _debug
+    example_suffix = "_debug" if config == "Debug" else ""
+
     tests_section = ""
     if tests:
         tests_section = (
@@ -166,6 +384,15 @@ def main(mode: str, tests: bool, clean: bool, verbose: bool,
             "  Run: [cyan]cd build && ctest[/cyan]\n"
         )
 
+    ninja_section = ""
+    if generator:
+        ninja_section = (
+            "\n[bold]Diagnose the build (flags after -- go to Ninja):[/bold]\n"
+            "  [cyan]uv run scripts/build.py -- -d stats[/cyan]    # Ninja internal timings\n"
+            "  [cyan]uv run scripts/build.py -- -d explain[/cyan]  # Why targets rebuild\n"
+            "  [cyan]uv run scripts/build.py -- -t graph[/cyan]    # Dependency graph (dot)\n"
+        )
+
     panel_text = (
         f"[bold green]Build Completed[/bold green]\n\n"
         f"[bold]Library output:[/bold]\n"
@@ -175,10 +402,19 @@ def main(mode: str, tests: bool, clean: bool, verbose: bool,
         f"{tests_section}"
         f"[bold]Run example:[/bold]\n"
         f"  export OPENAI_API_KEY=your_key\n"
-        f"  {build_dir}/examples/basic_chat\n"
+        f"  {build_dir}/examples/basic_chat{example_suffix}\n"
+        f"{ninja_section}"
     )
 
-    console.print(Panel.fit(panel_text, title="🎉 Success", border_style="green"))
+    from rich.panel import Panel
+
+    get_console().print(Panel.fit(panel_text, title="🎉 Success", border_style="green"))
+
+
+def main(argv: Optional[list[str]] = None):
+    """Build AI SDK C++."""
+    args, native_args = parse_args(sys.argv[1:] if argv is None else argv)
+    build(**vars(args), native_args=native_args)
 
 
 if __name__ == "__main__":